@@ -1,16 +1,15 @@
 import os
 import sys
 import re
-import smtplib
+import shelve
+import operator
+import contextlib
+import orjson
 import requests
-import pandas as pd
 from datetime import datetime
-from collections import defaultdict
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from tabulate import tabulate
-from openpyxl import load_workbook
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # === CONFIGURABLE RECIPIENTS ===
 EMAIL_RECIPIENTS = [
@@ -23,125 +22,272 @@ EMAIL_CC = [
     "shivam.m@browserstack.com"
 ]
 
+# Upper bound on concurrent build fetches (and pooled keep-alive connections)
+MAX_WORKERS = 16
+# Read size when streaming consoleText
+CONSOLE_CHUNK_SIZE = 1 << 16
+# Parsed results of finished builds persist here across runs
+CACHE_FILE = ".jenkins_cache.db"
+# Bump whenever parsing changes so results cached by an older parser are dropped
+CACHE_VERSION = 2
+
+COUNT_KEYS = ("scenarios", "steps")
+COUNT_TYPES = ("total", "passed", "failed", "skipped")
+# Aggregated entries store counts positionally in COUNT_TYPES order
+_count_values = operator.itemgetter(*COUNT_TYPES)
+
+# === PRECOMPILED PATTERNS ===
+_SUMMARY_RE = re.compile(r"^(?:\[(\d{4}-\d{2}-\d{2}.*?)Z\]|\b(\d{2}:\d{2}:\d{2}))\s+(\d+ \w+ \(.*\))", re.MULTILINE)
+_TERM_RE = re.compile(r"\d+m\d+\.\d+s \(executing steps: ")
+_COUNT_TOKEN_RE = re.compile(r"(\d+) (\w+)")
+_SCENARIO_RE = re.compile(r"Scenario: (.*?)\s*#")
+_ENV_RES = (
+    re.compile(r"Started by timer with parameters: \{[^}]*ENV=([^,}]+)", re.IGNORECASE),
+    re.compile(r"ENV=([A-Za-z0-9_]+)", re.IGNORECASE),
+    re.compile(r"Environment[:=]\s*([A-Za-z0-9_]+)", re.IGNORECASE),
+    re.compile(r"Run environment:\s*([A-Za-z0-9_]+)", re.IGNORECASE)
+)
+# Labels reported inside the summary parentheses, e.g. "12 scenarios (2 failed, 1 skipped, 9 passed)"
+COUNT_LABELS = ("failed", "passed", "skipped")
+
+def _parse_counts(line):
+    total_s, _, rest = line.partition(" ")
+    inside = rest.partition("(")[2].partition(")")[0].lower()
+    # Same "<digits> <word>" matching as before, so ANSI colours or trailing words don't hide a count;
+    # a repeated label keeps its last count
+    values = {label: int(count) for count, label in _COUNT_TOKEN_RE.findall(inside)}
+    counts = {"total": int(total_s) if total_s.isdigit() else 0}
+    for label in COUNT_LABELS:
+        counts[label] = values.get(label, 0)
+    return counts
+
 class JenkinsLogParser:
     def __init__(self, base_job_url, username, api_token):
         self.base_job_url = base_job_url.rstrip("/")
         self.auth = (username, api_token)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        adapter = HTTPAdapter(
+            pool_connections=MAX_WORKERS,
+            pool_maxsize=MAX_WORKERS,
+            max_retries=Retry(total=3, backoff_factor=0.3)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def get_build_info(self, build_number):
         url = f"{self.base_job_url}/{build_number}/api/json"
-        response = requests.get(url, auth=self.auth)
-        return response.json() if response.status_code == 200 else None
+        response = self.session.get(url)
+        return orjson.loads(response.content) if response.status_code == 200 else None
 
-    def fetch_console_log(self, build_number):
+    def stream_console_log(self, build_number):
+        """Open consoleText as a gzip-encoded stream; the caller closes the returned response."""
         url = f"{self.base_job_url}/{build_number}/consoleText"
-        response = requests.get(url, auth=self.auth)
-        return response.text if response.status_code == 200 else None
+        response = self.session.get(url, stream=True)
+        if response.status_code != 200:
+            response.close()
+            return None
+        response.encoding = response.encoding or "utf-8"
+        return response
 
     def parse_counts_from_line(self, line):
-        total_match = re.match(r"\d+", line)
-        total = int(total_match.group(0)) if total_match else 0
-
-        failed = passed = skipped = 0
-        counts_match = re.search(r"\((.*?)\)", line)
-        if counts_match:
-            for count, label in re.findall(r"(\d+) (\w+)", counts_match.group(1)):
-                count = int(count)
-                label = label.lower()
-                if label == "failed": failed = count
-                elif label == "passed": passed = count
-                elif label == "skipped": skipped = count
-
-        return {"total": total, "failed": failed, "passed": passed, "skipped": skipped}
-
-    def extract_summary_counts(self, console_output):
-        pattern = re.compile(r"^(?:\[(\d{4}-\d{2}-\d{2}.*?)Z\]|\b(\d{2}:\d{2}:\d{2}))\s+(\d+ \w+ \(.*\))", re.MULTILINE)
-        matches = pattern.findall(console_output)
-        if len(matches) >= 2:
-            return {
-                "scenarios": self.parse_counts_from_line(matches[0][2]),
-                "steps": self.parse_counts_from_line(matches[1][2])
-            }
-        return {}
+        return _parse_counts(line)
 
     def extract_failures(self, console_output):
-        match = re.search(r"Failures:(.*?)(?=\d+m\d+\.\d+s \(executing steps: )", console_output, re.DOTALL)
-        if match:
-            return re.findall(r"Scenario: (.*?)\s*#", match.group(1))
-        return []
-
-    def extract_env(self, output):
-        patterns = [
-            r"Started by timer with parameters: \{[^}]*ENV=([^,}]+)",
-            r"ENV=([A-Za-z0-9_]+)",
-            r"Environment[:=]\s*([A-Za-z0-9_]+)",
-            r"Run environment:\s*([A-Za-z0-9_]+)"
-        ]
-        for pat in patterns:
-            match = re.search(pat, output, re.IGNORECASE)
-            if match:
-                return match.group(1).strip().lower()
-        return "unknown"
-
-    def aggregate_last_n_builds_by_date_and_env(self, n=5):
-        url = f"{self.base_job_url}/lastBuild/api/json"
-        resp = requests.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            print("❌ Failed to get latest build info.")
-            return {}
+        # Plain find for the marker; the regexes only ever see the bounded block
+        start = console_output.find("Failures:")
+        if start < 0:
+            return []
+        start += len("Failures:")
+        term = _TERM_RE.search(console_output, start)
+        if not term:
+            return []
+        return _SCENARIO_RE.findall(console_output, start, term.start())
+
+    def parse_console(self, lines):
+        """Single pass over console lines for env, summary and failures; returns (env, counts, fails).
+
+        Only the Failures: block is buffered, so memory stays bounded by that block rather than the log.
+        """
+        # Index into _ENV_RES of the best env marker seen so far; only higher-priority patterns are still searched
+        best = len(_ENV_RES)
+        env = "unknown"
+        summaries = []
+        block = None
+        fails = []
+        failures_done = False
+        for line in lines:
+            if not failures_done:
+                closed = None
+                if block is not None:
+                    block.append(line)
+                    closed = _TERM_RE.search(line)
+                else:
+                    idx = line.find("Failures:")
+                    if idx >= 0:
+                        block = [line[idx:]]
+                        closed = _TERM_RE.search(line, idx + len("Failures:"))
+                if closed:
+                    fails = self.extract_failures("\n".join(block))
+                    failures_done = True
+
+            for idx in range(best):
+                match = _ENV_RES[idx].search(line)
+                if match:
+                    best = idx
+                    env = match.group(1).strip().lower()
+                    break
+
+            summary = _SUMMARY_RE.match(line)
+            if summary:
+                summaries.append(summary.group(3))
+            if best == 0 and len(summaries) >= 2 and failures_done:
+                break
+
+        counts = {}
+        if len(summaries) >= 2:
+            counts = {
+                "scenarios": self.parse_counts_from_line(summaries[0]),
+                "steps": self.parse_counts_from_line(summaries[1])
+            }
+        return env, counts, fails
+
+    def _process_build(self, build_number):
+        info = self.get_build_info(build_number)
+        if not info: return None
 
-        latest = resp.json()["number"]
-        data = defaultdict(lambda: defaultdict(lambda: {
-            "builds": [],
-            "scenarios": {"total": 0, "passed": 0, "failed": 0, "skipped": 0},
-            "steps": {"total": 0, "passed": 0, "failed": 0, "skipped": 0},
-            "failed_scenarios": []
-        }))
+        date_str = datetime.fromtimestamp(info["timestamp"] // 1000).strftime('%Y-%m-%d')
+        response = self.stream_console_log(build_number)
+        if response is None: return None
 
-        for i in range(latest, latest - n, -1):
-            info = self.get_build_info(i)
-            if not info: continue
+        with response:
+            lines = response.iter_lines(chunk_size=CONSOLE_CHUNK_SIZE, decode_unicode=True)
+            env, counts, fails = self.parse_console(lines)
+        if env not in ["prod", "preprod"]:
+            env = "ran_manually"
 
-            date_str = datetime.fromtimestamp(info["timestamp"] // 1000).strftime('%Y-%m-%d')
-            console = self.fetch_console_log(i)
-            if not console: continue
+        # Builds still running may print more results later, so they must not be cached
+        return date_str, env, counts, fails, build_number, bool(info.get("building"))
 
-            env = self.extract_env(console)
-            if env not in ["prod", "preprod"]:
-                env = "ran_manually"
+    def aggregate_last_n_builds_by_date_and_env(self, n=5, cache_file=CACHE_FILE):
+        url = f"{self.base_job_url}/lastBuild/api/json"
+        resp = self.session.get(url)
+        if resp.status_code != 200:
+            print("❌ Failed to get latest build info.")
+            return {}
 
-            counts = self.extract_summary_counts(console)
-            fails = self.extract_failures(console)
-            entry = data[date_str][env]
+        latest = orjson.loads(resp.content)["number"]
+        data = {}
+
+        builds = range(latest, latest - n, -1)
+        results = {}
+        cache_ctx = shelve.open(cache_file) if cache_file else contextlib.nullcontext({})
+        # Keys carry the parser version and job URL so jobs and parser revisions never share entries
+        version_prefix = f"v{CACHE_VERSION}|"
+        job_prefix = f"{version_prefix}{self.base_job_url}|"
+        keys = {i: f"{job_prefix}{i}" for i in builds}
+        with cache_ctx as cache:
+            misses = []
+            for i in builds:
+                if keys[i] in cache:
+                    results[i] = cache[keys[i]] + (i, False)
+                else:
+                    misses.append(i)
+
+            if misses:
+                with ThreadPoolExecutor(max_workers=min(len(misses), MAX_WORKERS)) as executor:
+                    for i, result in zip(misses, executor.map(self._process_build, misses)):
+                        results[i] = result
+                        if not result: continue
+
+                        date_str, env, counts, fails, _i, building = result
+                        if not building:
+                            cache[keys[i]] = (date_str, env, counts, fails)
+
+            # Evict this job's builds that fell out of the window, and anything from another parser version
+            wanted = set(keys.values())
+            for key in list(cache):
+                if key not in wanted and (key.startswith(job_prefix) or not key.startswith(version_prefix)):
+                    del cache[key]
+
+        for i in builds:
+            result = results[i]
+            if not result: continue
+
+            date_str, env, counts, fails, i, _building = result
+            envs = data.setdefault(date_str, {})
+            entry = envs.get(env)
+            if entry is None:
+                entry = envs[env] = {
+                    "builds": [],
+                    "scenarios": [0, 0, 0, 0],
+                    "steps": [0, 0, 0, 0],
+                    "failed_scenarios": []
+                }
 
             entry["builds"].append(i)
-            for key in ["scenarios", "steps"]:
-                for typ in ["total", "passed", "failed", "skipped"]:
-                    entry[key][typ] += counts.get(key, {}).get(typ, 0)
+            for key in COUNT_KEYS:
+                key_counts = counts.get(key)
+                if key_counts:
+                    entry[key] = [a + b for a, b in zip(entry[key], _count_values(key_counts))]
             entry["failed_scenarios"].extend(fails)
 
-        return dict(data)
+        return data
+
+EXCEL_KEY_COLUMNS = ["date", "builds", "environment"]
 
 def save_to_excel(df, filename="jenkins_summary.xlsx", sheet="Summary"):
-    if os.path.exists(filename):
-        book = load_workbook(filename)
-        if sheet in book.sheetnames:
-            df_old = pd.read_excel(filename, sheet_name=sheet)
-            df = pd.concat([df_old, df], ignore_index=True)
-            df.drop_duplicates(subset=["date", "builds", "environment"], keep="last", inplace=True)
-    with pd.ExcelWriter(filename, engine="openpyxl", mode="w") as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet)
+    # Heavy imports are deferred until there is something to write
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    if not os.path.exists(filename):
+        with pd.ExcelWriter(filename, engine="xlsxwriter") as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet)
+        print(f"✅ Excel saved: {filename}")
+        return
+
+    book = load_workbook(filename)
+    if sheet in book.sheetnames:
+        ws = book[sheet]
+        header = [cell.value for cell in ws[1]]
+    else:
+        ws = book.create_sheet(sheet)
+        header = []
+    for col in df.columns:
+        if col not in header:
+            header.append(col)
+            ws.cell(row=1, column=len(header), value=col)
+
+    # Single scan of the existing key columns; rows with a known key are overwritten in place
+    key_idx = [header.index(col) for col in EXCEL_KEY_COLUMNS]
+    existing = {}
+    for row_num, values in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        existing[tuple(str(values[i]) for i in key_idx)] = row_num
+
+    col_pos = {col: header.index(col) + 1 for col in df.columns}
+    for record in df.to_dict("records"):
+        key = tuple(str(record[col]) for col in EXCEL_KEY_COLUMNS)
+        row_num = existing.get(key)
+        if row_num is None:
+            row_num = existing[key] = ws.max_row + 1
+        for col, value in record.items():
+            ws.cell(row=row_num, column=col_pos[col], value=value)
+
+    book.save(filename)
     print(f"✅ Excel saved: {filename}")
 
 def colorize_stability(value):
-    if value >= 95:
-        return f'<td style="color:green;font-weight:bold">{value:.2f}</td>'
-    elif value >= 80:
-        return f'<td style="color:orange;font-weight:bold">{value:.2f}</td>'
-    else:
-        return f'<td style="color:red;font-weight:bold">{value:.2f}</td>'
+    color = "green" if value >= 95 else "orange" if value >= 80 else "red"
+    return f'<span style="color:{color};font-weight:bold">{value:.2f}</span>'
 
 def send_email_report(subject, df, attachments):
+    import smtplib
+    import mimetypes
+    from email import policy
+    from email.message import EmailMessage
+
     sender = os.getenv("EMAIL_USER")
     password = os.getenv("EMAIL_PASS")
 
@@ -149,47 +295,44 @@ def send_email_report(subject, df, attachments):
         print("❌ Missing EMAIL_USER or EMAIL_PASS env vars.")
         return
 
-    msg = MIMEMultipart()
+    # 7bit policy: sendmail() doesn't negotiate 8BITMIME, so every part must be 7-bit clean
+    msg = EmailMessage(policy=policy.SMTP.clone(cte_type="7bit"))
     msg["From"] = sender
     msg["To"] = ", ".join(EMAIL_RECIPIENTS)
     msg["Cc"] = ", ".join(EMAIL_CC)
     msg["Subject"] = subject
 
     # HTML Table with highlighted stability
-    headers = df.columns.tolist()
-    rows = []
-    for _, row in df.iterrows():
-        html_row = ""
-        for col in headers:
-            if col == "stability":
-                html_row += colorize_stability(row[col])
-            else:
-                html_row += f"<td>{row[col]}</td>"
-        rows.append(f"<tr>{html_row}</tr>")
+    table = df.to_html(index=False, escape=False, border=1, formatters={"stability": colorize_stability})
+    table = table.replace('<table border="1" class="dataframe">', '<table border="1" cellpadding="6" cellspacing="0">', 1)
 
     html_table = f"""
     <html><body>
     <h2>📊 Jenkins Daily Report</h2>
-    <table border="1" cellpadding="6" cellspacing="0">
-    <thead><tr>{"".join([f"<th>{h}</th>" for h in headers])}</tr></thead>
-    <tbody>{"".join(rows)}</tbody>
-    </table>
+    {table}
     </body></html>
     """
 
-    msg.attach(MIMEText(html_table, "html"))
+    msg.set_content(html_table, subtype="html", cte="quoted-printable")
 
+    # Text attachments (csv/html) go as text parts: 7bit when ASCII with short lines, else QP or base64
     for path in attachments:
-        with open(path, "rb") as f:
-            part = MIMEApplication(f.read(), Name=os.path.basename(path))
-            part["Content-Disposition"] = f'attachment; filename="{os.path.basename(path)}"'
-            msg.attach(part)
-
+        filename = os.path.basename(path)
+        ctype, _ = mimetypes.guess_type(path)
+        maintype, subtype = (ctype or "application/octet-stream").split("/", 1)
+        if maintype == "text":
+            with open(path, encoding="utf-8") as f:
+                msg.add_attachment(f.read(), subtype=subtype, filename=filename)
+        else:
+            with open(path, "rb") as f:
+                msg.add_attachment(f.read(), maintype=maintype, subtype=subtype, filename=filename)
+
+    payload = msg.as_bytes()
     recipients = EMAIL_RECIPIENTS + EMAIL_CC
     try:
         with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
             server.login(sender, password)
-            server.sendmail(sender, recipients, msg.as_string())
+            server.sendmail(sender, recipients, payload)
         print("📧 Email sent successfully.")
     except Exception as e:
         print(f"❌ Failed to send email: {e}")
@@ -210,14 +353,12 @@ if __name__ == "__main__":
         print("❌ No Jenkins data found.")
         sys.exit(1)
 
-    latest_date = sorted(results.keys(), reverse=True)[0]
+    latest_date = max(results)
     rows = []
 
     for env, data in results[latest_date].items():
-        total = data["scenarios"]["total"]
-        passed = data["scenarios"]["passed"]
-        failed = data["scenarios"]["failed"]
-        skipped = data["scenarios"]["skipped"]
+        total, passed, failed, skipped = data["scenarios"]
+        steps_total, steps_passed, steps_failed, steps_skipped = data["steps"]
         stability = (passed / total * 100) if total > 0 else 0
         failure_pct = (failed / total * 100) if total > 0 else 0
 
@@ -231,13 +372,14 @@ if __name__ == "__main__":
             "scenarios_passed": passed,
             "scenarios_failed": failed,
             "scenarios_skipped": skipped,
-            "steps_total": data["steps"]["total"],
-            "steps_passed": data["steps"]["passed"],
-            "steps_failed": data["steps"]["failed"],
-            "steps_skipped": data["steps"]["skipped"],
+            "steps_total": steps_total,
+            "steps_passed": steps_passed,
+            "steps_failed": steps_failed,
+            "steps_skipped": steps_skipped,
             "failed_scenarios": "; ".join(sorted(set(data["failed_scenarios"])))
         })
 
+    import pandas as pd
     df = pd.DataFrame(rows)
 
     # Save outputs